@@ -5,35 +5,361 @@ A Flask-based web service that processes PSD files to generate JPG variants.
 """
 
 import os
+import atexit
+import base64
+import fcntl
+import hashlib
+import itertools
+import json
 import logging
+import queue
+import shutil
+import struct
+import sys
 import tempfile
+import time
 import uuid
 from datetime import datetime
+from email.utils import formatdate
+from logging.handlers import QueueHandler, QueueListener
 from pathlib import Path
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Iterable, Optional, Tuple
+from urllib.parse import urlparse
 
-from flask import Flask, request, jsonify, send_from_directory
+import httpx
+from flask import Flask, request, jsonify, make_response, send_from_directory, abort
 from werkzeug.utils import secure_filename
+from werkzeug.security import safe_join
+from werkzeug.exceptions import RequestEntityTooLarge
+from flask_compress import Compress
 from psd_tools import PSDImage
-from psd_layer_processor import PSDProcessor  # Import the PSD processor
+from celery.result import AsyncResult
+from tasks import celery, run_psd_job, CACHE_MANIFEST_FILE
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+# Configure logging: handlers only enqueue records, a listener thread does the writing
+log_handler = QueueHandler(queue.Queue(-1))
+logging.basicConfig(level=logging.INFO, handlers=[log_handler], force=True)
 logger = logging.getLogger(__name__)
 
+class StderrHandler(logging.StreamHandler):
+    """Stream handler that writes to the current sys.stderr rather than the one at creation."""
+    
+    @property
+    def stream(self):
+        return sys.stderr
+    
+    @stream.setter
+    def stream(self, value):
+        pass
+
+def start_log_listener() -> QueueListener:
+    """Start the thread that drains queued log records to stderr."""
+    global log_listener
+    # Use a fresh queue: after a fork the inherited one may hold another thread's lock
+    log_handler.queue = queue.Queue(-1)
+    log_listener = QueueListener(log_handler.queue, StderrHandler())
+    log_listener.start()
+    return log_listener
+
+start_log_listener()
+atexit.register(lambda: log_listener.stop())
+
+# Threads do not survive fork (gunicorn preload_app), so each worker starts its own listener
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=start_log_listener)
+
 # Initialize Flask app
 app = Flask(__name__)
 app.config['MAX_CONTENT_LENGTH'] = 100 * 1024 * 1024  # 100MB max file size
-app.config['UPLOAD_FOLDER'] = os.path.join(tempfile.gettempdir(), 'psd_uploads')
-app.config['OUTPUT_FOLDER'] = os.path.join(tempfile.gettempdir(), 'psd_outputs')
+app.config['MAX_CANVAS_PIXELS'] = 100_000_000  # 100MP max canvas (~400MB RGBA composite)
+
+# Keep uploads on RAM-backed tmpfs when it has room for several jobs; they are deleted once
+# processed. Generated variants are served for a long time, so they stay on disk.
+TMPFS_DIR = '/dev/shm'
+TMPFS_MIN_FREE = 10 * app.config['MAX_CONTENT_LENGTH']
+
+def default_upload_dir() -> str:
+    """Return the tmpfs directory if usable, otherwise the system temp directory."""
+    try:
+        if os.access(TMPFS_DIR, os.W_OK) and shutil.disk_usage(TMPFS_DIR).free >= TMPFS_MIN_FREE:
+            return TMPFS_DIR
+    except OSError:
+        pass
+    return tempfile.gettempdir()
+
+app.config['UPLOAD_FOLDER'] = os.environ.get('UPLOAD_FOLDER', os.path.join(default_upload_dir(), 'psd_uploads'))
+app.config['OUTPUT_FOLDER'] = os.environ.get('OUTPUT_FOLDER', os.path.join(tempfile.gettempdir(), 'psd_outputs'))
+app.config['CACHE_FOLDER'] = os.environ.get('CACHE_FOLDER', os.path.join(tempfile.gettempdir(), 'psd_cache'))
+
+# Offload result downloads to the front-end server instead of reading them through Python:
+# USE_X_SENDFILE emits X-Sendfile (Apache/lighttpd); X_ACCEL_REDIRECT_PREFIX names an
+# nginx internal location aliased to OUTPUT_FOLDER (e.g. /internal-outputs/)
+app.config['USE_X_SENDFILE'] = os.environ.get('USE_X_SENDFILE', '').lower() in ('1', 'true', 'yes')
+app.config['X_ACCEL_REDIRECT_PREFIX'] = os.environ.get('X_ACCEL_REDIRECT_PREFIX')
+
+# Compress JSON responses only; JPEG results are already entropy-coded
+app.config['COMPRESS_MIMETYPES'] = ['application/json']
+Compress(app)
 
-# Ensure upload and output directories exist
+# Result files never change once written (job ID + filename), so clients may cache them
+RESULT_CACHE_MAX_AGE = 365 * 24 * 60 * 60
+
+# Buffer size used when streaming request and download bodies to disk
+COPY_BUFFER_SIZE = 1024 * 1024
+
+# Shared HTTP client for URL downloads: keep-alive and HTTP/2 across jobs to the same host
+http_client = httpx.Client(
+    http2=True,
+    follow_redirects=True,
+    limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+    timeout=60.0
+)
+
+# Ensure upload, output and cache directories exist
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 os.makedirs(app.config['OUTPUT_FOLDER'], exist_ok=True)
+os.makedirs(app.config['CACHE_FOLDER'], exist_ok=True)
+
+# tus resumable upload protocol
+TUS_VERSION = '1.0.0'
+UPLOAD_CHUNK_SIZE = 5 * 1024 * 1024  # Recommended client chunk size
+UPLOAD_META_FILE = 'upload.json'
+UPLOAD_DATA_FILE = 'upload.psd'
+UPLOAD_EXPIRY = 24 * 60 * 60  # Incomplete uploads are deleted after a day without a chunk
+
+# JPEG qualities offered by the API
+ALLOWED_QUALITIES = (60, 75, 85, 90, 95)
+DEFAULT_QUALITY = 90
+
+def parse_quality(value: Any) -> Optional[int]:
+    """Parse a requested JPEG quality, returning None if it is not one of ALLOWED_QUALITIES."""
+    try:
+        quality = int(value)
+    except (TypeError, ValueError):
+        return None
+    return quality if quality in ALLOWED_QUALITIES else None
+
+# PSD file header: signature, version, reserved, channels, height, width, depth, color mode
+PSD_HEADER_SIZE = 26
+PSD_MAX_DIMENSION = {1: 30000, 2: 300000}  # Per format version (PSD, PSB)
+
+def file_sha256(path: str) -> str:
+    """Compute the SHA-256 hex digest of a file without loading it into memory."""
+    with open(path, 'rb') as f:
+        if hasattr(hashlib, 'file_digest'):  # Python 3.11+
+            return hashlib.file_digest(f, 'sha256').hexdigest()
+        digest = hashlib.sha256()
+        for chunk in iter(lambda: f.read(COPY_BUFFER_SIZE), b''):
+            digest.update(chunk)
+        return digest.hexdigest()
+
+def save_chunks(chunks: Iterable[bytes], path: str, max_size: Optional[int] = None) -> str:
+    """
+    Write chunks of bytes to disk, hashing them in the same pass.
+    
+    Args:
+        chunks: Iterable of byte strings
+        path: Destination file path
+        max_size: Maximum number of bytes to accept (optional)
+        
+    Returns:
+        SHA-256 hex digest of the written bytes
+        
+    Raises:
+        RequestEntityTooLarge: If more than max_size bytes arrive
+    """
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, 'wb') as f:
+        for chunk in chunks:
+            size += len(chunk)
+            if max_size is not None and size > max_size:
+                raise RequestEntityTooLarge()
+            f.write(chunk)
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def save_stream(stream, path: str, head: bytes = b'') -> str:
+    """Write a readable binary file-like object (after any already-read head) to disk; see save_chunks."""
+    return save_chunks(itertools.chain([head], iter(lambda: stream.read(COPY_BUFFER_SIZE), b'')), path)
+
+def read_psd_header(stream, size: int = PSD_HEADER_SIZE) -> bytes:
+    """Read the fixed-size PSD file header (or its first size bytes) from the start of a stream."""
+    head = b''
+    while len(head) < size:
+        chunk = stream.read(size - len(head))
+        if not chunk:
+            break
+        head += chunk
+    return head
+
+def check_psd_header(head: bytes) -> Optional[Tuple[str, int]]:
+    """
+    Validate a PSD file header before the file is written to disk.
+    
+    Args:
+        head: First PSD_HEADER_SIZE bytes of the file
+        
+    Returns:
+        (error message, HTTP status) if the header is rejected, None otherwise
+    """
+    if len(head) < PSD_HEADER_SIZE or head[:4] != b'8BPS':
+        return 'Invalid file. Not a PSD file.', 400
+    
+    # Version 1 is PSD, version 2 is PSB (large document format)
+    version, = struct.unpack('>H', head[4:6])
+    if version not in PSD_MAX_DIMENSION:
+        return f'Unsupported PSD version: {version}', 400
+    
+    height, width = struct.unpack('>II', head[14:22])
+    max_dimension = PSD_MAX_DIMENSION[version]
+    if not (1 <= width <= max_dimension and 1 <= height <= max_dimension):
+        return f'Invalid PSD dimensions: {width}x{height}', 400
+    
+    # Compositing allocates width * height * 4 bytes; refuse canvases that could exhaust memory
+    if width * height > app.config['MAX_CANVAS_PIXELS']:
+        return f'PSD canvas too large: {width}x{height}', 413
+    
+    return None
+
+def load_cached_result(cache_key: str, psd_path: str, output_dir: str) -> Optional[Dict[str, Any]]:
+    """
+    Link the results of an earlier identical job into a new job's output directory.
+    
+    Args:
+        cache_key: Content hash of the PSD plus quality
+        psd_path: Path to the saved PSD file for the new job
+        output_dir: Output directory for the new job
+        
+    Returns:
+        Job result dict on a cache hit, None otherwise
+    """
+    cache_dir = os.path.join(app.config['CACHE_FOLDER'], cache_key)
+    manifest_path = os.path.join(cache_dir, CACHE_MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return None
+    
+    # Output names are prefixed with the input file's stem, which may differ between uploads
+    input_stem = Path(psd_path).stem
+    generated_files = []
+    try:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        # Mark the entry as recently used so cache pruning keeps it
+        os.utime(manifest_path)
+        
+        cached_stem = manifest['input_stem']
+        os.mkdir(output_dir)
+        for cached_name in manifest['generated_files']:
+            filename = input_stem + cached_name[len(cached_stem):]
+            # Hard links keep served results intact when the cache entry is evicted
+            src = os.path.join(cache_dir, cached_name)
+            dst = os.path.join(output_dir, filename)
+            try:
+                os.link(src, dst)
+            except OSError:
+                shutil.copy2(src, dst)
+            generated_files.append(filename)
+    except OSError as e:
+        # The entry was evicted while we were reading it; process the PSD instead
+        logger.warning(f"Could not use cache entry {cache_dir}: {e}")
+        shutil.rmtree(output_dir, ignore_errors=True)
+        return None
+    
+    return {
+        'input_file': os.path.basename(psd_path),
+        'output_dir': output_dir,
+        'generated_files': generated_files,
+        'cached': True,
+        'success': True
+    }
 
-def allowed_file(filename: str) -> bool:
-    """Check if the file has an allowed extension."""
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in {'psd'}
+def queue_job(job_id: str, psd_path: str, quality: int,
+              digest: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """
+    Queue a saved PSD file for background processing.
+    
+    Identical inputs (same bytes and quality) reuse the results of an earlier job.
+    
+    Args:
+        job_id: Job ID, also used as the Celery task ID
+        psd_path: Path to the saved PSD file
+        quality: JPEG quality requested by the client
+        digest: SHA-256 of the PSD if already computed while saving it
+        
+    Returns:
+        Job result dict if served from the cache, None if the job was queued
+    """
+    # The worker creates the output directory; only cache hits need it here
+    output_dir = os.path.join(app.config['OUTPUT_FOLDER'], job_id)
+    
+    digest = digest or file_sha256(psd_path)
+    cache_key = f"{digest}_{quality}"
+    cached = load_cached_result(cache_key, psd_path, output_dir)
+    if cached:
+        # Record the result so /api/status reports it like any other job
+        celery.backend.store_result(job_id, cached, 'SUCCESS')
+        # The upload is not needed any more (the worker deletes it for queued jobs)
+        shutil.rmtree(os.path.dirname(psd_path), ignore_errors=True)
+        logger.info(f"Served {psd_path} from cache ({cache_key})")
+        return cached
+    
+    # Hand the PSD off to the worker pool; the job ID doubles as the task ID
+    cache_dir = os.path.join(app.config['CACHE_FOLDER'], cache_key)
+    run_psd_job.apply_async(args=(psd_path, output_dir, quality, cache_dir, digest), task_id=job_id)
+    logger.info(f"Queued PSD file for processing: {psd_path}")
+    return None
+
+def parse_upload_metadata(header: str) -> Dict[str, str]:
+    """Decode a tus Upload-Metadata header ("key base64value,key base64value")."""
+    metadata = {}
+    for pair in header.split(','):
+        pair = pair.strip()
+        if not pair:
+            continue
+        key, _, value = pair.partition(' ')
+        metadata[key] = base64.b64decode(value).decode('utf-8') if value else ''
+    return metadata
+
+def write_json_atomic(path: str, data: Dict[str, Any]):
+    """Replace a JSON file in one step, so concurrent readers never see it half-written."""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(fd, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+def upload_expires(data_path: str) -> str:
+    """Format the Upload-Expires time of a resumable upload (last chunk + UPLOAD_EXPIRY)."""
+    return formatdate(os.path.getmtime(data_path) + UPLOAD_EXPIRY, usegmt=True)
+
+def expire_uploads():
+    """Delete resumable uploads that were never completed and have expired."""
+    cutoff = time.time() - UPLOAD_EXPIRY
+    for entry in os.scandir(app.config['UPLOAD_FOLDER']):
+        meta_path = os.path.join(entry.path, UPLOAD_META_FILE)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            if meta.get('queued'):
+                # Completed: the worker deletes it once processed
+                continue
+            with open(os.path.join(entry.path, meta['filename']), 'rb') as f:
+                if os.fstat(f.fileno()).st_mtime >= cutoff:
+                    continue
+                # Skip uploads a PATCH is still writing to
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                shutil.rmtree(entry.path, ignore_errors=True)
+        except (OSError, ValueError, KeyError):
+            continue
+        logger.info(f"Expired incomplete upload {entry.name}")
+
+def tus_response(body: Any = '', status: int = 204, **headers):
+    """Build a response carrying the tus protocol headers."""
+    resp = make_response(body, status)
+    resp.headers['Tus-Resumable'] = TUS_VERSION
+    for name, value in headers.items():
+        resp.headers[name.replace('_', '-')] = str(value)
+    return resp
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
@@ -44,46 +370,82 @@ def health_check():
         'service': 'psd-processor'
     })
 
-@app.route('/api/process', methods=['POST'])
+@app.route('/api/process', methods=['POST', 'PUT'])
 def process_psd():
     """
-    Process a PSD file and generate JPG variants.
+    Queue a PSD file for processing into JPG variants.
     
     Accepts a PSD file either as a file upload or a URL to download the file.
+    Returns 202 with a job ID immediately; poll /api/status/<job_id> for the result.
     
     Request format (multipart/form-data):
     - file: The PSD file to process (optional if url is provided)
     - url: URL to download the PSD file (optional if file is provided)
     - output_format: Desired output format (default: 'jpg')
-    - quality: JPEG quality (1-100, default: 90)
+    - quality: JPEG quality, one of 60, 75, 85, 90, 95 (default: 90)
+    
+    Alternatively, PUT the raw PSD bytes (Content-Type: application/octet-stream)
+    with ?filename=name.psd; the body is streamed straight to disk. output_format
+    and quality may then be given as query parameters.
     """
     # Check if the request has a file or URL
-    if 'file' not in request.files and 'url' not in request.form:
+    if request.method == 'PUT':
+        if not request.args.get('filename', '').lower().endswith('.psd'):
+            return jsonify({
+                'error': 'Invalid file type. Only PSD files are allowed.',
+                'success': False
+            }), 400
+    elif 'file' not in request.files and 'url' not in request.form:
         return jsonify({
             'error': 'No file or URL provided',
             'success': False
         }), 400
     
+    quality = parse_quality(request.values.get('quality', DEFAULT_QUALITY))
+    if quality is None:
+        return jsonify({
+            'error': f'Invalid quality. Allowed values: {", ".join(map(str, ALLOWED_QUALITIES))}',
+            'success': False
+        }), 400
+    
     # Create a unique job ID for this request
     job_id = str(uuid.uuid4())
     logger.info(f"Starting job {job_id}")
     
+    # Temporary directory for this job (job IDs are fresh, the parent exists)
+    job_dir = os.path.join(app.config['UPLOAD_FOLDER'], job_id)
+    queued = False
     try:
-        # Create a temporary directory for this job
-        job_dir = os.path.join(app.config['UPLOAD_FOLDER'], job_id)
-        os.makedirs(job_dir, exist_ok=True)
+        os.mkdir(job_dir)
         
-        # Handle file upload
+        # Handle raw body upload
         psd_path = None
-        if 'file' in request.files:
+        digest = None
+        if request.method == 'PUT':
+            filename = secure_filename(request.args['filename']) or f'upload_{job_id}.psd'
+            psd_path = os.path.join(job_dir, filename)
+            head = read_psd_header(request.stream)
+            error = check_psd_header(head)
+            if error:
+                return jsonify({'error': error[0], 'success': False}), error[1]
+            digest = save_stream(request.stream, psd_path, head)
+            logger.info(f"Saved streamed upload to {psd_path}")
+        
+        # Handle file upload
+        elif 'file' in request.files:
             file = request.files['file']
-            if file.filename == '':
+            filename = file.filename or ''
+            if filename == '':
                 return jsonify({'error': 'No selected file', 'success': False}), 400
                 
-            if file and allowed_file(file.filename):
-                filename = secure_filename(file.filename)
+            if filename.lower().endswith('.psd'):
+                filename = secure_filename(filename)
                 psd_path = os.path.join(job_dir, filename)
-                file.save(psd_path)
+                head = read_psd_header(file.stream)
+                error = check_psd_header(head)
+                if error:
+                    return jsonify({'error': error[0], 'success': False}), error[1]
+                digest = save_stream(file.stream, psd_path, head)
                 logger.info(f"Saved uploaded file to {psd_path}")
             else:
                 return jsonify({
@@ -93,14 +455,8 @@ def process_psd():
         
         # Handle URL download
         elif 'url' in request.form:
-            import requests
-            from urllib.parse import urlparse
-            
             url = request.form['url']
             try:
-                response = requests.get(url, stream=True)
-                response.raise_for_status()
-                
                 # Extract filename from URL or generate one
                 filename = os.path.basename(urlparse(url).path) or f'upload_{job_id}.psd'
                 if not filename.lower().endswith('.psd'):
@@ -108,12 +464,29 @@ def process_psd():
                     
                 psd_path = os.path.join(job_dir, filename)
                 
-                with open(psd_path, 'wb') as f:
-                    for chunk in response.iter_content(chunk_size=8192):
-                        f.write(chunk)
+                # Stream the body to disk in 1MB chunks over a pooled connection, hashing as it arrives
+                # The same size limit as uploads applies, whatever the server claims to send
+                max_size = app.config['MAX_CONTENT_LENGTH']
+                with http_client.stream('GET', url) as response:
+                    response.raise_for_status()
+                    content_length = response.headers.get('Content-Length', '')
+                    if content_length.isdigit() and int(content_length) > max_size:
+                        raise RequestEntityTooLarge()
+                    chunks = response.iter_bytes(COPY_BUFFER_SIZE)
+                    head = next(chunks, b'')
+                    error = check_psd_header(head[:PSD_HEADER_SIZE])
+                    if error:
+                        return jsonify({'error': error[0], 'success': False}), error[1]
+                    digest = save_chunks(itertools.chain([head], chunks), psd_path, max_size)
                 
                 logger.info(f"Downloaded file from {url} to {psd_path}")
                 
+            except RequestEntityTooLarge:
+                logger.error(f"File at {url} exceeds {app.config['MAX_CONTENT_LENGTH']} bytes")
+                return jsonify({
+                    'error': 'File at URL is too large',
+                    'success': False
+                }), 413
             except Exception as e:
                 logger.error(f"Error downloading file from URL: {e}")
                 return jsonify({
@@ -128,47 +501,23 @@ def process_psd():
                 'success': False
             }), 400
         
-        # Process the PSD file
-        logger.info(f"Processing PSD file: {psd_path}")
-        
-        # Get output format and quality from request
-        output_format = request.form.get('output_format', 'jpg').lower()
-        quality = int(request.form.get('quality', 90))
-        
-        # Create output directory for this job
-        output_dir = os.path.join(app.config['OUTPUT_FOLDER'], job_id)
-        os.makedirs(output_dir, exist_ok=True)
-        
-        # Process the PSD file
-        processor = PSDProcessor(psd_path, output_dir)
-        if not processor.load_psd():
-            return jsonify({
-                'error': 'Invalid PSD file structure',
-                'success': False
-            }), 400
+        # Get output format from request
+        output_format = request.values.get('output_format', 'jpg').lower()
         
-        # Process the PSD and get results
-        success, variants = processor.process()
-        if not success:
-            return jsonify({
-                'error': 'Failed to process PSD',
-                'success': False
-            }), 500
-            
-        # Get the list of generated files
-        results = [v['filename'] for v in variants if 'filename' in v]
+        cached = queue_job(job_id, psd_path, quality, digest)
+        queued = True
+        if cached:
+            return jsonify({'job_id': job_id, 'status': 'completed', **cached})
         
         # Prepare response
         response = {
             'job_id': job_id,
-            'status': 'completed',
+            'status': 'pending',
             'input_file': os.path.basename(psd_path),
-            'output_dir': output_dir,
-            'generated_files': [os.path.basename(f) for f in results],
             'success': True
         }
         
-        return jsonify(response)
+        return jsonify(response), 202
         
     except Exception as e:
         logger.error(f"Error processing PSD: {str(e)}", exc_info=True)
@@ -176,13 +525,208 @@ def process_psd():
             'error': f'Failed to process PSD: {str(e)}',
             'success': False
         }), 500
+    finally:
+        # Rejected and failed uploads would otherwise stay on tmpfs
+        if not queued:
+            shutil.rmtree(job_dir, ignore_errors=True)
+
+@app.route('/api/uploads', methods=['POST'])
+def create_upload():
+    """
+    Start a resumable (tus) PSD upload.
+    
+    Request headers:
+    - Upload-Length: Total size of the PSD file in bytes
+    - Upload-Metadata: Optional tus metadata; supports 'filename' and 'quality'
+    
+    The returned Location accepts PATCH requests carrying consecutive chunks.
+    Once the last byte arrives the PSD is queued under the upload's job ID.
+    """
+    try:
+        upload_length = int(request.headers['Upload-Length'])
+    except (KeyError, ValueError):
+        return jsonify({'error': 'Missing or invalid Upload-Length header', 'success': False}), 400
+    
+    if upload_length > app.config['MAX_CONTENT_LENGTH']:
+        return jsonify({'error': 'Invalid upload size', 'success': False}), 413
+    if upload_length < PSD_HEADER_SIZE:
+        return jsonify({'error': 'Invalid file. Not a PSD file.', 'success': False}), 400
+    
+    try:
+        metadata = parse_upload_metadata(request.headers.get('Upload-Metadata', ''))
+    except ValueError:
+        return jsonify({'error': 'Invalid Upload-Metadata header', 'success': False}), 400
+    
+    quality = parse_quality(metadata.get('quality', DEFAULT_QUALITY))
+    if quality is None:
+        return jsonify({
+            'error': f'Invalid quality. Allowed values: {", ".join(map(str, ALLOWED_QUALITIES))}',
+            'success': False
+        }), 400
+    
+    filename = secure_filename(metadata.get('filename', '')) or UPLOAD_DATA_FILE
+    if not filename.lower().endswith('.psd'):
+        return jsonify({
+            'error': 'Invalid file type. Only PSD files are allowed.',
+            'success': False
+        }), 400
+    
+    # Uploads live on tmpfs: reclaim the ones clients abandoned before adding another
+    expire_uploads()
+    
+    job_id = str(uuid.uuid4())
+    job_dir = os.path.join(app.config['UPLOAD_FOLDER'], job_id)
+    os.mkdir(job_dir)
+    
+    with open(os.path.join(job_dir, UPLOAD_META_FILE), 'w') as f:
+        json.dump({'length': upload_length, 'filename': filename, 'quality': quality}, f)
+    data_path = os.path.join(job_dir, filename)
+    open(data_path, 'wb').close()
+    
+    logger.info(f"Created upload {job_id} ({upload_length} bytes)")
+    return tus_response(
+        '', 201,
+        Location=f'/api/uploads/{job_id}',
+        Upload_Offset=0,
+        Upload_Expires=upload_expires(data_path),
+        X_Upload_Chunk_Size=UPLOAD_CHUNK_SIZE
+    )
+
+@app.route('/api/uploads/<job_id>', methods=['HEAD', 'PATCH'])
+def resume_upload(job_id: str):
+    """
+    Report the offset of a resumable upload (HEAD) or append a chunk to it (PATCH).
+    
+    PATCH requests must use Content-Type application/offset+octet-stream and send
+    the current Upload-Offset; the chunk is appended at that offset. A PATCH that
+    arrives while another is still writing the same upload gets 423 Locked.
+    """
+    job_dir = os.path.join(app.config['UPLOAD_FOLDER'], secure_filename(job_id))
+    meta_path = os.path.join(job_dir, UPLOAD_META_FILE)
+    if not os.path.exists(meta_path):
+        return tus_response('', 404)
+    
+    with open(meta_path) as f:
+        meta = json.load(f)
+    psd_path = os.path.join(job_dir, meta['filename'])
+    
+    if request.method == 'HEAD':
+        return tus_response('', 200, Upload_Offset=os.path.getsize(psd_path),
+                            Upload_Length=meta['length'], Upload_Expires=upload_expires(psd_path),
+                            Cache_Control='no-store')
+    
+    if request.mimetype != 'application/offset+octet-stream':
+        return tus_response('', 415)
+    
+    try:
+        client_offset = int(request.headers['Upload-Offset'])
+    except (KeyError, ValueError):
+        return tus_response('', 400)
+    
+    try:
+        f = open(psd_path, 'a+b')
+    except FileNotFoundError:
+        # Rejected or already processed and deleted
+        return tus_response('', 404)
+    with f:
+        # One PATCH at a time per upload: a client retrying a chunk while the first
+        # request is still streaming must not append the same bytes twice
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return tus_response('', 423)
+        
+        # Re-read under the lock: another request may have completed the upload
+        with open(meta_path) as meta_file:
+            meta = json.load(meta_file)
+        offset = os.fstat(f.fileno()).st_size
+        if client_offset != offset or offset >= meta['length']:
+            return tus_response('', 409, Upload_Offset=offset)
+        
+        # Reject a non-PSD upload as soon as its header is complete, however the
+        # client splits it across chunks, before any more of it is written
+        remaining = meta['length'] - offset
+        head = b''
+        if offset < PSD_HEADER_SIZE:
+            head = read_psd_header(request.stream, PSD_HEADER_SIZE - offset)
+            f.seek(0)
+            header = f.read() + head
+            if len(header) == PSD_HEADER_SIZE:
+                error = check_psd_header(header)
+                if error:
+                    shutil.rmtree(job_dir, ignore_errors=True)
+                    return tus_response({'error': error[0], 'success': False}, error[1])
+        
+        # Append the chunk, never writing past the declared length
+        f.write(head)
+        remaining -= len(head)
+        while remaining > 0:
+            chunk = request.stream.read(min(COPY_BUFFER_SIZE, remaining))
+            if not chunk:
+                break
+            f.write(chunk)
+            remaining -= len(chunk)
+        f.flush()
+        offset = os.fstat(f.fileno()).st_size
+        
+        # Queue only the transition to complete, and only once
+        if offset == meta['length'] and not meta.get('queued'):
+            meta['queued'] = True
+            write_json_atomic(meta_path, meta)
+            logger.info(f"Upload {job_id} complete: {psd_path}")
+            queue_job(job_id, psd_path, meta['quality'])
+    
+    if offset == meta['length']:
+        return tus_response('', 204, Upload_Offset=offset)
+    return tus_response('', 204, Upload_Offset=offset, Upload_Expires=upload_expires(psd_path))
+
+@app.route('/api/status/<job_id>', methods=['GET'])
+def get_job_status(job_id: str):
+    """Report the state of a queued PSD processing job."""
+    result = AsyncResult(job_id, app=celery)
+    
+    response = {
+        'job_id': job_id,
+        'status': result.state.lower(),
+    }
+    
+    if result.state == 'SUCCESS':
+        job_result = result.result or {}
+        if job_result.get('success'):
+            response['status'] = 'completed'
+        else:
+            response['status'] = 'failed'
+        response.update(job_result)
+    elif result.state == 'FAILURE':
+        response.update({
+            'status': 'failed',
+            'error': f'Failed to process PSD: {result.result}',
+            'success': False
+        })
+    
+    return jsonify(response)
 
 @app.route('/api/results/<job_id>/<filename>')
 def get_result_file(job_id: str, filename: str):
     """Serve a generated file."""
     output_dir = os.path.join(app.config['OUTPUT_FOLDER'], job_id)
-    return send_from_directory(output_dir, filename)
+    
+    accel_prefix = app.config['X_ACCEL_REDIRECT_PREFIX']
+    if accel_prefix:
+        # Let nginx stream the file with sendfile(); Flask only resolves the path
+        file_path = safe_join(app.config['OUTPUT_FOLDER'], job_id, filename)
+        if file_path is None or not os.path.isfile(file_path):
+            abort(404)
+        resp = make_response('')
+        resp.headers['X-Accel-Redirect'] = f"{accel_prefix.rstrip('/')}/{job_id}/{filename}"
+        del resp.headers['Content-Type']
+    else:
+        resp = send_from_directory(output_dir, filename, max_age=RESULT_CACHE_MAX_AGE)
+    
+    resp.headers['Cache-Control'] = f'public, max-age={RESULT_CACHE_MAX_AGE}, immutable'
+    return resp
 
 if __name__ == '__main__':
-    # Run the Flask app
+    # Development server only. In production run:
+    #   gunicorn -c gunicorn.conf.py app:app
     app.run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,35 @@
+"""
+Gunicorn configuration for the PSD Processing Web Service.
+
+PSD decoding and JPEG encoding run on the Celery workers, so the web
+workers only move uploads, downloads and status checks. That work is
+I/O-bound, so each worker multiplexes many connections with gevent.
+
+Usage:
+    gunicorn -c gunicorn.conf.py app:app
+"""
+
+# Make sockets cooperative before preload_app imports the app (and httpx, ssl) in the
+# master; importing app elsewhere (tests, flask run, scripts) leaves the interpreter alone
+from gevent import monkey
+monkey.patch_all()
+
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+
+workers = int(os.environ.get('GUNICORN_WORKERS', (2 * (os.cpu_count() or 1)) + 1))
+
+# I/O-bound workload: cooperative greenlets, up to worker_connections clients per worker
+worker_class = 'gevent'
+worker_connections = 1000
+
+# Large uploads and URL downloads can be slow
+timeout = 1500
+
+# Recycle workers periodically to reclaim memory held by psd_tools/PIL
+max_requests = 100
+max_requests_jitter = 10
+
+# Import the app (and psd_tools) once in the master so workers share pages copy-on-write
+preload_app = True
@@ -13,40 +13,222 @@ FIXES:
 """
 
 import os
+import gc
+import io
+import json
+import hashlib
 import logging
+import multiprocessing
 import tempfile
 import traceback
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from typing import List, Dict, Tuple, Optional
-from PIL import Image, ImageChops
+from PIL import Image
 from psd_tools import PSDImage
-from psd_tools.api.layers import PixelLayer, Group
+from psd_tools.composite import composite as composite_arrays
+from psd_tools.api.layers import Group, Layer
+from psd_tools.constants import BlendMode, ColorMode
 import shutil
+import numpy as np
+
+try:
+    # Optional: encode through libjpeg-turbo directly, bypassing PIL's Python layer
+    from turbojpeg import TurboJPEG, TJPF_RGB, TJSAMP_444
+    _turbo_jpeg = TurboJPEG()
+except Exception:
+    # PyTurboJPEG or the libturbojpeg shared library is not installed
+    _turbo_jpeg = None
+
+try:
+    # Optional: composite plain layer stacks with libvips (multithreaded, touches
+    # only each layer's bounding box)
+    import pyvips
+except Exception:
+    # pyvips or the libvips shared library is not installed
+    pyvips = None
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(levelname)s:%(name)s:%(message)s')
 logger = logging.getLogger(__name__)
 
+JPEG_QUALITY = 95
+
+# Every PSD/PSB file starts with this signature
+PSD_SIGNATURE = b'8BPS'
+
+# Visibility rule buckets, keyed by a layer's parent group
+BUCKET_BG = 0
+BUCKET_BASE = 1
+BUCKET_COLORS = 2
+BUCKET_CAMERA = 3
+BUCKET_MAIN = 4
+BUCKET_COLOR_GROUP_CHILD = 5
+BUCKET_OTHER = 6
+
+_PARENT_BUCKETS = {
+    'bg': BUCKET_BG,
+    'base': BUCKET_BASE,
+    'colors': BUCKET_COLORS,
+    'camera': BUCKET_CAMERA,
+    '@main': BUCKET_MAIN,
+}
+
+# Optional: encode on the GPU through nvJPEG (set USE_NVJPEG=1)
+USE_NVJPEG = os.environ.get('USE_NVJPEG', '').lower() in ('1', 'true', 'yes')
+
+
+def _load_nvjpeg():
+    """Return torchvision's nvJPEG-backed encoder if a CUDA device is available"""
+    try:
+        import torch
+        from torchvision.io import encode_jpeg
+    except ImportError:
+        logger.warning("USE_NVJPEG is set but torch/torchvision are not installed")
+        return None
+    if not torch.cuda.is_available():
+        logger.warning("USE_NVJPEG is set but no CUDA device is available")
+        return None
+    return encode_jpeg
+
+
+# Loaded on first use: probing CUDA before a fork (Celery prefork, gunicorn preload_app)
+# breaks it in the child processes that do the encoding
+_nvjpeg_encode = None
+_nvjpeg_loaded = False
+
+
+def _get_nvjpeg():
+    """Return the nvJPEG encoder if enabled and available, loading it once per process"""
+    global _nvjpeg_encode, _nvjpeg_loaded
+    if not _nvjpeg_loaded:
+        _nvjpeg_encode = _load_nvjpeg() if USE_NVJPEG else None
+        _nvjpeg_loaded = True
+    return _nvjpeg_encode
+
+
+# Optional: composite plain layer stacks on the GPU with PyTorch (set USE_GPU_COMPOSITE=1)
+USE_GPU_COMPOSITE = os.environ.get('USE_GPU_COMPOSITE', '').lower() in ('1', 'true', 'yes')
+
+
+def _load_torch_cuda():
+    """Return the torch module if a CUDA device is available"""
+    try:
+        import torch
+    except ImportError:
+        logger.warning("USE_GPU_COMPOSITE is set but torch is not installed")
+        return None
+    if not torch.cuda.is_available():
+        logger.warning("USE_GPU_COMPOSITE is set but no CUDA device is available")
+        return None
+    return torch
+
+
+# Loaded on first use, for the same fork-safety reason as the nvJPEG encoder
+_torch = None
+_torch_loaded = False
+
+
+def _get_torch():
+    """Return torch if GPU compositing is enabled and available, loading it once per process"""
+    global _torch, _torch_loaded
+    if not _torch_loaded:
+        _torch = _load_torch_cuda() if USE_GPU_COMPOSITE else None
+        _torch_loaded = True
+    return _torch
+
+
+def _encode_jpeg(image: Image.Image, quality: int = JPEG_QUALITY):
+    """Encode an image to JPEG bytes, using nvJPEG or libjpeg-turbo directly when available"""
+    nvjpeg_encode = _get_nvjpeg()
+    if nvjpeg_encode is not None and image.mode == 'RGB':
+        import torch
+        tensor = torch.from_numpy(np.asarray(image)).permute(2, 0, 1).contiguous().cuda()
+        return nvjpeg_encode(tensor, quality=quality).cpu().numpy().tobytes()
+    if _turbo_jpeg is not None and image.mode == 'RGB':
+        return _turbo_jpeg.encode(np.asarray(image), quality=quality,
+                                  pixel_format=TJPF_RGB, jpeg_subsample=TJSAMP_444)
+    buf = io.BytesIO()
+    # Baseline, single-pass encode: the optimized Huffman pass costs far more than it saves at q95
+    image.save(buf, 'JPEG', quality=quality, subsampling=0, optimize=False, progressive=False)
+    return buf.getbuffer()
+
+
+def _image_md5(image: Image.Image, rows: int = 256) -> str:
+    """MD5 of an image's raw pixels, hashed in row strips to avoid a full-frame copy"""
+    h = hashlib.md5()
+    width, height = image.size
+    for top in range(0, height, rows):
+        h.update(image.crop((0, top, width, min(top + rows, height))).tobytes())
+    return h.hexdigest()
+
+
+# Per-process processor used by render workers, loaded once by _init_render_worker
+_worker_processor = None
+
+
+def _init_render_worker(psd_path: str, output_dir: str, quality: int,
+                        cache_dir: Optional[str] = None, psd_digest: Optional[str] = None):
+    """Open the PSD once in a render worker process"""
+    global _worker_processor
+    processor = PSDProcessor(psd_path, output_dir, quality=quality, cache_dir=cache_dir,
+                             psd_digest=psd_digest)
+    if not processor.load_psd():
+        raise RuntimeError(f"Render worker could not load {psd_path}")
+    _worker_processor = processor
+
+
+def _render_one(color: str, output_path: str) -> Optional[Tuple[Tuple[int, int], str, str, int]]:
+    """Render and save one color variant (runs in a worker process)"""
+    return _worker_processor._render_variant(color, output_path)
+
+
 class PSDProcessor:
     """
     Main class for processing PSD files and generating JPG variants
     """
     
-    def __init__(self, psd_path: str, output_dir: str = None):
+    def __init__(self, psd_path: str, output_dir: str = None, max_workers: Optional[int] = None,
+                 quality: int = JPEG_QUALITY, cache_dir: Optional[str] = None,
+                 psd_digest: Optional[str] = None):
         """
         Initialize the PSD processor
         
         Args:
             psd_path: Path to the PSD file
             output_dir: Directory to save output files
+            max_workers: Maximum processes used to render variants (default: CPU count)
+            quality: JPEG quality of the generated variants
+            cache_dir: Directory to memoise rendered variants in across runs (optional)
+            psd_digest: Content hash of the PSD; keys the memo by content instead of by
+                the file's path, mtime and size (optional)
         """
         self.psd_path = Path(psd_path)
         self.output_dir = Path(output_dir) if output_dir else Path(tempfile.mkdtemp())
+        self.max_workers = max_workers
+        self.quality = quality
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.psd_digest = psd_digest
         self.psd = None
+        self._layer_index = []
+        self._all_colors_set = frozenset()
+        self._group_colors = {}
+        self._container_groups = []
+        self._base_visibility = {}
+        self._color_layer_ids = {}
+        self._color_layer_counts = {}
+        self._bg_layer_ids = frozenset()
+        self._bg_cache = None
+        self._plain_layers = None
+        self._vips_pixels = {}
+        self._gpu_pixels = {}
         self.required_groups = ['@main', 'camera', 'colors', 'base', 'bg']
         
         # Create output directory
         self.output_dir.mkdir(parents=True, exist_ok=True)
+        if self.cache_dir:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
         
     def load_psd(self) -> bool:
         """
@@ -58,17 +240,14 @@ class PSDProcessor:
         try:
             logger.info(f"Loading PSD file: {self.psd_path}")
             
-            # Try loading with ignore_unknown_layer_properties to handle SheetColorType error
-            try:
-                self.psd = PSDImage.open(self.psd_path, ignore_unknown_layer_properties=True)
-            except TypeError:
-                # Fallback for older versions of psd-tools
-                self.psd = PSDImage.open(self.psd_path)
+            self.psd = self._open_psd()
             
             # Validate required group structure
             if not self._validate_psd_structure():
                 logger.error("PSD structure validation failed")
                 return False
+            
+            self._index_layers()
                 
             logger.info("PSD loaded and validated successfully")
             return True
@@ -77,6 +256,27 @@ class PSDProcessor:
             logger.error(f"Failed to load PSD: {e}", exc_info=True)
             return False
     
+    def _open_psd(self) -> PSDImage:
+        """
+        Open and parse the PSD file, rejecting non-PSD data up front
+        
+        Returns:
+            Parsed PSDImage
+        """
+        with open(self.psd_path, 'rb') as f:
+            # Cheap header check before handing the file to the parser
+            if f.read(len(PSD_SIGNATURE)) != PSD_SIGNATURE:
+                raise ValueError(f"Not a PSD file (bad signature): {self.psd_path}")
+            
+            # Try loading with ignore_unknown_layer_properties to handle SheetColorType error
+            try:
+                f.seek(0)
+                return PSDImage.open(f, ignore_unknown_layer_properties=True)
+            except TypeError:
+                # Fallback for older versions of psd-tools
+                f.seek(0)
+                return PSDImage.open(f)
+    
     def _validate_psd_structure(self) -> bool:
         """
         Validate that PSD has required group structure
@@ -99,7 +299,7 @@ class PSDProcessor:
             main_group = self._get_group_by_name('@main')
             if main_group:
                 metalware_found = any('metalware' in layer.name.lower() 
-                                    for layer in main_group if hasattr(layer, 'name'))
+                                    for layer in main_group if isinstance(layer, Layer))
                 if not metalware_found:
                     logger.warning("@main group should contain metalware layer")
             
@@ -140,7 +340,7 @@ class PSDProcessor:
         
         colors = []
         for layer in group:
-            if hasattr(layer, 'name') and layer.name:
+            if isinstance(layer, Layer) and layer.name:
                 # Extract color name (assuming format like "blue", "red", etc.)
                 color_name = layer.name.lower().strip()
                 if color_name and color_name not in colors:
@@ -155,9 +355,9 @@ class PSDProcessor:
         Returns:
             Dict mapping color names to validation status
         """
-        camera_colors = self._get_layer_colors('camera')
-        colors_group_colors = self._get_layer_colors('colors')
-        base_colors = self._get_layer_colors('base')
+        camera_colors = self._group_colors['camera']
+        colors_group_colors = self._group_colors['colors']
+        base_colors = self._group_colors['base']
         
         valid_colors = {}
         
@@ -172,162 +372,398 @@ class PSDProcessor:
         
         return valid_colors
     
-    def _get_all_layer_names(self, group=None, prefix=''):
-        """Recursively get all layer names with their full paths"""
-        if group is None:
-            group = self.psd
+    def _index_layers(self):
+        """
+        Classify every layer once so each color's visibility pass is a table lookup
+        """
+        self._group_colors = {group_name: self._get_layer_colors(group_name)
+                              for group_name in ['camera', 'colors', 'base']}
+        self._all_colors_set = frozenset(color for colors in self._group_colors.values()
+                                         for color in colors)
+        
+        # Top-level container groups that every color shows
+        self._container_groups = [
+            layer for layer in self.psd
+            if isinstance(layer, Group)
+            and layer.name.lower().strip() in ['bg', 'base', 'colors', 'camera', '@main']
+        ]
+        
+        self._layer_index = []
+        for layer in self.psd.descendants():
+            if not isinstance(layer, Layer):
+                continue
+            layer_name = layer.name.lower().strip()
+            parent_name = layer.parent.name.lower() if layer.parent else 'root'
+            bucket = _PARENT_BUCKETS.get(parent_name)
+            if bucket is None:
+                bucket = BUCKET_COLOR_GROUP_CHILD if parent_name in self._all_colors_set else BUCKET_OTHER
+            self._layer_index.append((layer, layer_name, parent_name, bucket))
+        
+        # Most visibility does not depend on the color: precompute it once and record,
+        # per color, the few layers that color shows on top of it
+        self._base_visibility = {id(layer): True for layer in self._container_groups}
+        self._color_layer_ids = {}
+        self._color_layer_counts = {}
+        for layer, layer_name, parent_name, bucket in self._layer_index:
+            if bucket == BUCKET_COLOR_GROUP_CHILD:
+                # Inside a color group (e.g. red/Layer 16 copy)
+                color, counted = parent_name, True
+            elif (bucket in (BUCKET_BASE, BUCKET_COLORS, BUCKET_CAMERA, BUCKET_MAIN)
+                  and layer_name in self._all_colors_set):
+                # A color layer in base/colors/camera/@main; @main is not validated
+                color, counted = layer_name, bucket != BUCKET_MAIN
+            else:
+                # bg, other and non-color layers are always shown
+                self._base_visibility[id(layer)] = True
+                continue
+            self._base_visibility[id(layer)] = False
+            self._color_layer_ids.setdefault(color, []).append(id(layer))
+            if counted:
+                self._color_layer_counts[color] = self._color_layer_counts.get(color, 0) + 1
+        
+        # The bg render can be shared by every color when bg is the bottom layer and
+        # nothing inside it depends on the color
+        self._bg_layer_ids = frozenset()
+        self._bg_cache = None
+        bg_group = self._get_group_by_name('bg')
+        if bg_group is not None and self.psd[0] is bg_group:
+            bg_ids = {id(bg_group)} | {id(layer) for layer in bg_group.descendants()}
+            if all(bucket in (BUCKET_BG, BUCKET_OTHER)
+                   for layer, _, _, bucket in self._layer_index if id(layer) in bg_ids):
+                self._bg_layer_ids = frozenset(bg_ids)
+        
+        self._plain_layers = self._index_plain_layers()
+        self._vips_pixels = {}
+        self._gpu_pixels = {}
+    
+    def _index_plain_layers(self) -> Optional[List]:
+        """
+        List the pixel layers for the GPU and libvips compositors, bottom to top
+        
+        Only plain normal-blend stacks are handed to them: libvips' other blend modes
+        treat partially transparent layers differently from Photoshop.
+        
+        Returns:
+            List of (pixel layer, enclosing groups), or None if neither backend is
+            available or the document uses features only psd-tools composites correctly
+        """
+        if (pyvips is None and _get_torch() is None) or self.psd.color_mode != ColorMode.RGB:
+            return None
         
         layers = []
-        for layer in group:
-            layer_name = f"{prefix}{layer.name}"
-            layers.append(layer_name)
-            if hasattr(layer, 'layers'):  # It's a group
-                layers.extend(self._get_all_layer_names(layer, f"{layer_name}/"))
+        for layer in self.psd.descendants():
+            if layer.clipping or layer.has_clip_layers() or layer.has_effects():
+                return None
+            if layer.has_vector_mask() or (layer.mask is not None and
+                                           (layer.mask.has_real() or layer.mask.parameters)):
+                return None
+            if isinstance(layer, Group):
+                if layer.opacity != 255 or layer.blend_mode not in (BlendMode.NORMAL,
+                                                                     BlendMode.PASS_THROUGH):
+                    return None
+                continue
+            if (layer.kind != 'pixel' or layer.fill_opacity != 255
+                    or layer.blend_mode != BlendMode.NORMAL):
+                return None
+            ancestors = []
+            parent = layer.parent
+            while isinstance(parent, Group):
+                ancestors.append(parent)
+                parent = parent.parent
+            layers.append((layer, ancestors))
         return layers
-
-    def _set_layer_visibility_fixed(self, psd, target_color):
+    
+    def _layer_rgba(self, layer) -> Optional[np.ndarray]:
         """
-        CORRECTED: Properly set layer visibility for target color
+        Straight-alpha RGBA pixels of a layer with its mask and opacity applied
         
-        Key insight: The issue is that we're hiding the target color layers in 'base/' 
-        while showing 'red' layers, causing all variants to look identical.
+        Args:
+            layer: Pixel layer
+            
+        Returns:
+            (height, width, 4) uint8 array, or None if the layer has no pixels
         """
-        logger.info(f"Setting up layers for color: {target_color}")
+        image = layer.topil() if layer.has_pixels() else None
+        if image is None:
+            return None
         
-        # Get all color names from all groups
-        all_colors = set()
-        for group_name in ['camera', 'colors', 'base']:
-            group_colors = self._get_layer_colors(group_name)
-            all_colors.update(group_colors)
+        rgba = np.array(image.convert('RGBA'))
+        alpha = rgba[..., 3].astype(np.float32)
         
-        logger.info(f"Found colors: {all_colors}")
-        logger.info(f"Target color: {target_color}")
+        mask = layer.mask
+        if mask is not None and not mask.disabled:
+            # Outside its bounding box the mask takes its background color
+            coverage = np.full(alpha.shape, mask.background_color / 255.0, dtype=np.float32)
+            x0, y0 = max(mask.left, layer.left), max(mask.top, layer.top)
+            x1, y1 = min(mask.right, layer.right), min(mask.bottom, layer.bottom)
+            if x0 < x1 and y0 < y1:
+                mask_values = np.asarray(mask.topil(), dtype=np.float32) / 255.0
+                coverage[y0 - layer.top:y1 - layer.top, x0 - layer.left:x1 - layer.left] = \
+                    mask_values[y0 - mask.top:y1 - mask.top, x0 - mask.left:x1 - mask.left]
+            alpha *= coverage
         
-        # Step 1: Always show these top-level groups
-        for layer in psd:
-            if isinstance(layer, Group):
-                group_name = layer.name.lower().strip()
-                if group_name in ['bg', 'base', 'colors', 'camera', '@main']:
-                    layer.visible = True
-                    logger.debug(f"Container group '{layer.name}' -> SHOW")
-        
-        # Step 2: Handle layer visibility within groups
-        for layer in psd.descendants():
-            if not hasattr(layer, 'visible'):
-                continue
-                
-            layer_name = layer.name.lower().strip()
-            parent_name = layer.parent.name.lower() if layer.parent else 'root'
+        if layer.opacity != 255:
+            alpha *= layer.opacity / 255.0
+        rgba[..., 3] = np.clip(alpha, 0, 255).round().astype(np.uint8)
+        return rgba
+    
+    def _vips_layer_pixels(self, layer):
+        """
+        Layer pixels as a libvips image, cached per layer
+        
+        Args:
+            layer: Pixel layer
             
-            # Always show background layers
-            if parent_name == 'bg':
-                layer.visible = True
-                logger.debug(f"Background layer '{layer.name}' -> SHOW")
-                continue
+        Returns:
+            pyvips Image, or None if the layer has no pixels
+        """
+        key = id(layer)
+        if key not in self._vips_pixels:
+            rgba = self._layer_rgba(layer)
+            pixels = None
+            if rgba is not None:
+                pixels = pyvips.Image.new_from_memory(
+                    rgba.tobytes(), rgba.shape[1], rgba.shape[0], 4, 'uchar'
+                ).copy(interpretation='srgb')
+            self._vips_pixels[key] = pixels
+        return self._vips_pixels[key]
+    
+    def _gpu_layer_pixels(self, layer):
+        """
+        Layer pixels clipped to the canvas and uploaded to the GPU, cached per layer
+        
+        Args:
+            layer: Pixel layer
             
-            # Handle layers in the 'base' group - THIS IS THE KEY FIX
-            if parent_name == 'base':
-                # Only show the target color layer group in base
-                if layer_name == target_color.lower():
-                    layer.visible = True
-                    logger.debug(f"Target base layer '{layer.name}' -> SHOW")
-                elif layer_name in all_colors:
-                    layer.visible = False
-                    logger.debug(f"Non-target base layer '{layer.name}' -> HIDE")
-                else:
-                    layer.visible = True
-                    logger.debug(f"Non-color base layer '{layer.name}' -> SHOW")
-                continue
+        Returns:
+            Tuple of (premultiplied color, alpha, x0, y0) with float16 CHW tensors,
+            or None if the layer has no pixels on the canvas
+        """
+        key = id(layer)
+        if key not in self._gpu_pixels:
+            entry = None
+            rgba = self._layer_rgba(layer)
+            if rgba is not None:
+                x0, y0 = max(layer.left, 0), max(layer.top, 0)
+                x1 = min(layer.left + rgba.shape[1], self.psd.width)
+                y1 = min(layer.top + rgba.shape[0], self.psd.height)
+                if x0 < x1 and y0 < y1:
+                    rgba = rgba[y0 - layer.top:y1 - layer.top, x0 - layer.left:x1 - layer.left]
+                    pixels = _get_torch().from_numpy(np.ascontiguousarray(rgba)).cuda()
+                    pixels = pixels.permute(2, 0, 1).float().div_(255.0)
+                    alpha = pixels[3:]
+                    entry = ((pixels[:3] * alpha).half(), alpha.half(), x0, y0)
+            self._gpu_pixels[key] = entry
+        return self._gpu_pixels[key]
+    
+    def _composite_gpu(self, psd, visibility: Dict[int, bool]) -> Optional[Image.Image]:
+        """
+        Composite the visible layers on the GPU, blending each layer only over its own region
+        
+        Args:
+            psd: Loaded PSD
+            visibility: Layer visibility for the current color, keyed by id(layer)
             
-            # Handle layers in the 'colors' group
-            if parent_name == 'colors':
-                if layer_name == target_color.lower():
-                    layer.visible = True
-                    logger.debug(f"Target colors layer '{layer.name}' -> SHOW")
-                elif layer_name in all_colors:
-                    layer.visible = False
-                    logger.debug(f"Non-target colors layer '{layer.name}' -> HIDE")
-                else:
-                    layer.visible = True
-                    logger.debug(f"Non-color colors layer '{layer.name}' -> SHOW")
+        Returns:
+            Composited RGB PIL Image, or None if nothing is visible
+        """
+        torch = _get_torch()
+        # Premultiplied accumulators over a transparent backdrop
+        color = torch.zeros((3, psd.height, psd.width), dtype=torch.float32, device='cuda')
+        alpha = torch.zeros((1, psd.height, psd.width), dtype=torch.float32, device='cuda')
+        drawn = False
+        
+        for layer, ancestors in self._plain_layers:
+            # A layer shows only if it and every enclosing group are visible
+            if not visibility[id(layer)] or not all(visibility[id(group)] for group in ancestors):
                 continue
-            
-            # Handle layers in the 'camera' group
-            if parent_name == 'camera':
-                if layer_name == target_color.lower():
-                    layer.visible = True
-                    logger.debug(f"Target camera layer '{layer.name}' -> SHOW")
-                elif layer_name in all_colors:
-                    layer.visible = False
-                    logger.debug(f"Non-target camera layer '{layer.name}' -> HIDE")
-                else:
-                    layer.visible = True
-                    logger.debug(f"Non-color camera layer '{layer.name}' -> SHOW")
+            entry = self._gpu_layer_pixels(layer)
+            if entry is None:
                 continue
+            layer_color, layer_alpha, x0, y0 = entry
+            y1, x1 = y0 + layer_alpha.shape[1], x0 + layer_alpha.shape[2]
             
-            # Handle layers in '@main' group
-            if parent_name == '@main':
-                # Show color-specific layers only if they match target
-                if layer_name in all_colors:
-                    if layer_name == target_color.lower():
-                        layer.visible = True
-                        logger.debug(f"@main layer '{layer.name}' matches target color -> SHOW")
-                    else:
-                        layer.visible = False
-                        logger.debug(f"@main layer '{layer.name}' is non-target color -> HIDE")
-                else:
-                    # Non-color layers (e.g., 'steel', 'metalware') stay visible
-                    layer.visible = True
-                    logger.debug(f"@main non-color layer '{layer.name}' -> SHOW")
-                continue
+            # Over operator: I = (1 - a) * I + a * C, in premultiplied form
+            keep = 1.0 - layer_alpha.float()
+            color[:, y0:y1, x0:x1].mul_(keep).add_(layer_color.float())
+            alpha[:, y0:y1, x0:x1].mul_(keep).add_(layer_alpha.float())
+            drawn = True
+        if not drawn:
+            return None
+        
+        # Back to straight color; uncovered pixels take the white backdrop color, as in psd-tools
+        result = torch.where(alpha > 0, color / alpha.clamp(min=1e-6), torch.ones_like(color))
+        result = result.mul_(255.0).round_().clamp_(0, 255).to(torch.uint8)
+        return Image.fromarray(result.permute(1, 2, 0).contiguous().cpu().numpy(), 'RGB')
+    
+    def _composite_vips(self, psd, visibility: Dict[int, bool]) -> Optional[Image.Image]:
+        """
+        Composite the visible layers with libvips in a single multi-image pass
+        
+        Args:
+            psd: Loaded PSD
+            visibility: Layer visibility for the current color, keyed by id(layer)
             
-            # Handle layers within color groups (e.g., red/Layer 16 copy)
-            if parent_name in all_colors:
-                # If we're in a color group, show only if it matches our target
-                if parent_name == target_color.lower():
-                    layer.visible = True
-                    logger.debug(f"Layer '{layer.name}' in target color group '{parent_name}' -> SHOW")
-                else:
-                    layer.visible = False
-                    logger.debug(f"Layer '{layer.name}' in non-target color group '{parent_name}' -> HIDE")
+        Returns:
+            Composited RGB PIL Image, or None if nothing is visible
+        """
+        images, xs, ys = [], [], []
+        for layer, ancestors in self._plain_layers:
+            # A layer shows only if it and every enclosing group are visible
+            if not visibility[id(layer)] or not all(visibility[id(group)] for group in ancestors):
+                continue
+            pixels = self._vips_layer_pixels(layer)
+            if pixels is None:
                 continue
+            images.append(pixels)
+            xs.append(layer.left)
+            ys.append(layer.top)
+        if not images:
+            return None
+        
+        # Transparent white backdrop, as psd-tools uses
+        base = (pyvips.Image.black(psd.width, psd.height, bands=4) + [255, 255, 255, 0])
+        base = base.cast('uchar').copy(interpretation='srgb')
+        result = base.composite(images, ['over'] * len(images), x=xs, y=ys,
+                                premultiplied=False).cast('uchar')
+        # Drop alpha inside libvips so only RGB pixels are copied out
+        result = result.extract_band(0, n=3)
+        return Image.frombuffer('RGB', (psd.width, psd.height), result.write_to_memory(),
+                                'raw', 'RGB', 0, 1)
+    
+    def _composite_visible(self, psd, visibility: Dict[int, bool]) -> Image.Image:
+        """
+        Composite the visible layers, reusing the bg render across colors when possible
+        
+        Args:
+            psd: Loaded PSD
+            visibility: Layer visibility for the current color, keyed by id(layer)
             
-            # Default: show other layers
-            layer.visible = True
-            logger.debug(f"Other layer '{layer.name}' (parent: {parent_name}) -> SHOW")
+        Returns:
+            Composited PIL Image
+        """
+        if self._plain_layers is not None:
+            if _get_torch() is not None:
+                rendered = self._composite_gpu(psd, visibility)
+            else:
+                rendered = self._composite_vips(psd, visibility)
+            if rendered is not None:
+                return rendered
+        
+        is_visible = lambda l: visibility.get(id(l), l.visible)
+        
+        # psd-tools measures group bounds from the layers' own flags rather than the
+        # filter, so flip the ones that differ for the duration of the composite
+        changed = [(layer, layer.visible) for layer, _, _, _ in self._layer_index
+                   if layer.visible != visibility[id(layer)]]
+        for layer, visible in changed:
+            layer.visible = not visible
+        
+        try:
+            bg_ids = self._bg_layer_ids
+            if not bg_ids:
+                return psd.composite(layer_filter=is_visible)
+            
+            if self._bg_cache is None:
+                bg_filter = lambda l: is_visible(l) and id(l) in bg_ids
+                color, _, alpha = composite_arrays(psd, layer_filter=bg_filter)
+                self._bg_cache = (color, alpha, psd.composite(layer_filter=bg_filter).convert('RGBA'))
+            bg_color, bg_alpha, bg_image = self._bg_cache
+            
+            # Blend the rest over the cached bg, then lay the result on top of it
+            foreground = psd.composite(color=bg_color, alpha=bg_alpha,
+                                       layer_filter=lambda l: is_visible(l) and id(l) not in bg_ids)
+            return Image.alpha_composite(bg_image, foreground.convert('RGBA'))
+        finally:
+            for layer, visible in changed:
+                layer.visible = visible
+    
+    def _get_all_layer_names(self, group=None, prefix=''):
+        """Get all layer names with their full paths, in depth-first order"""
+        if group is None:
+            group = self.psd
+        
+        layers = []
+        # Explicit stack instead of recursion: no depth limit on deeply nested PSDs
+        stack = deque((layer, prefix) for layer in reversed(list(group)))
+        while stack:
+            layer, layer_prefix = stack.pop()
+            layer_name = f"{layer_prefix}{layer.name}"
+            layers.append(layer_name)
+            if isinstance(layer, Group):
+                stack.extend((child, f"{layer_name}/") for child in reversed(list(layer)))
+        return layers
 
-    def _render_layer_combination_fixed(self, color_name: str) -> Image.Image:
+    def _layer_visibility_fixed(self, target_color: str) -> Tuple[Dict[int, bool], int, int]:
         """
-        CORRECTED: Render layer combination with proper visibility handling and blending
+        CORRECTED: Work out layer visibility for target color
+        
+        Key insight: The issue is that we're hiding the target color layers in 'base/' 
+        while showing 'red' layers, causing all variants to look identical.
+        
+        The PSD itself is not modified; callers composite with the returned overrides.
+        
+        Returns:
+            Tuple of (visibility keyed by id(layer), target color layers visible,
+            other color layers visible)
         """
-        # Open a fresh copy of the PSD for each render
-        psd = PSDImage.open(str(self.psd_path))
+        logger.info(f"Setting up layers for color: {target_color}")
+        
+        target = target_color.lower()
+        
+        logger.info(f"Found colors: {set(self._all_colors_set)}")
+        logger.info(f"Target color: {target_color}")
+        
+        # Start from the color-independent visibility and show the target's color layers
+        visibility = self._base_visibility.copy()
+        for layer_id in self._color_layer_ids.get(target, ()):
+            visibility[layer_id] = True
+        
+        # Count visible color layers for validation; only the target's are ever shown
+        target_visible = self._color_layer_counts.get(target, 0)
+        other_visible = 0
+        
+        if logger.isEnabledFor(logging.DEBUG):
+            for layer in self._container_groups:
+                logger.debug(f"Container group '{layer.name}' -> SHOW")
+            for layer, _, parent_name, _ in self._layer_index:
+                logger.debug(f"Layer '{layer.name}' (parent: {parent_name}) -> "
+                             f"{'SHOW' if visibility[id(layer)] else 'HIDE'}")
+        
+        return visibility, target_visible, other_visible
 
+    def _render_layer_combination_fixed(self, psd, color_name: str) -> Image.Image:
+        """
+        CORRECTED: Render layer combination with proper visibility handling and blending
+        
+        The loaded PSD is reused for every color; visibility is passed as per-color overrides.
+        """
         try:
             logger.info(f"Rendering combination for color: {color_name}")
             
-            # Apply corrected visibility settings
-            self._set_layer_visibility_fixed(psd, color_name)
+            # Work out corrected visibility settings
+            visibility, target_visible, other_visible = self._layer_visibility_fixed(color_name)
+            is_visible = lambda l: visibility.get(id(l), l.visible)
             
             # Validate visibility settings
-            validation_passed = self._validate_visibility_settings(psd, color_name)
+            validation_passed = self._validate_visibility_settings(target_visible, other_visible)
             
             # Debug: Log visible layers and their blend modes
-            visible_layers = []
-            hidden_layers = []
-            for layer in psd.descendants():
-                if hasattr(layer, 'visible'):
+            if logger.isEnabledFor(logging.DEBUG):
+                visible_layers = []
+                hidden_layers = []
+                for layer, _, _, _ in self._layer_index:
                     parent_name = layer.parent.name if layer.parent else 'Root'
                     blend_mode = getattr(layer, 'blend_mode', 'normal')
                     opacity = getattr(layer, 'opacity', 1.0)
                     layer_info = f"{parent_name}/{layer.name} (blend: {blend_mode}, opacity: {opacity})"
-                    if layer.visible:
+                    if is_visible(layer):
                         visible_layers.append(layer_info)
                     else:
                         hidden_layers.append(layer_info)
-            
-            logger.info(f"Visible layers for {color_name}:\n" + "\n".join(f"- {l}" for l in visible_layers))
-            logger.info(f"Hidden layers for {color_name}:\n" + "\n".join(f"- {l}" for l in hidden_layers))
+                
+                logger.debug(f"Visible layers for {color_name}:\n" + "\n".join(f"- {l}" for l in visible_layers))
+                logger.debug(f"Hidden layers for {color_name}:\n" + "\n".join(f"- {l}" for l in hidden_layers))
             
             # Render the image with proper handling of blend modes and opacity
             rendered_image = None
@@ -335,7 +771,10 @@ class PSDProcessor:
             # Try composite with blend modes preserved
             try:
                 logger.info("Attempting composite with blend modes...")
-                rendered_image = psd.composite(layer_filter=lambda l: l.visible)
+                rendered_image = self._composite_visible(psd, visibility)
+                # Drop alpha straight away so later passes touch 3 bytes per pixel, not 4
+                if rendered_image and rendered_image.mode != 'RGB':
+                    rendered_image = rendered_image.convert('RGB')
                 if rendered_image and rendered_image.size[0] > 1 and rendered_image.size[1] > 1:
                     logger.info("✅ Composite with blend modes successful")
                 else:   
@@ -349,39 +788,42 @@ class PSDProcessor:
             if not rendered_image:
                 try:
                     logger.info("Attempting flattened composite...")
-                    # Create a new blank image with white background
-                    bg_color = (255, 255, 255)  # White background
-                    rendered_image = Image.new('RGB', (psd.width, psd.height), bg_color)
+                    # Blend into a float canvas with a white background
+                    canvas = np.full((psd.height, psd.width, 3), 255.0, dtype=np.float32)
                     
                     # Manually composite visible layers from bottom to top
                     for layer in psd.descendants(include_clip=True):
-                        if hasattr(layer, 'visible') and layer.visible:
+                        if isinstance(layer, Layer) and is_visible(layer):
                             try:
                                 layer_img = layer.topil()
                                 if layer_img:
-                                    # Apply layer opacity
-                                    if hasattr(layer, 'opacity') and layer.opacity < 1.0:
-                                        if layer_img.mode == 'RGBA':
-                                            # Create a new alpha channel with adjusted opacity
-                                            alpha = layer_img.split()[3]
-                                            alpha = alpha.point(lambda p: p * layer.opacity)
-                                            layer_img.putalpha(alpha)
+                                    # Get layer position, clipped to the canvas
+                                    left, top = layer.offset
+                                    x0, y0 = max(left, 0), max(top, 0)
+                                    x1 = min(left + layer_img.width, psd.width)
+                                    y1 = min(top + layer_img.height, psd.height)
+                                    if x0 >= x1 or y0 >= y1:
+                                        continue
+                                    
+                                    pixels = np.asarray(layer_img.convert('RGBA'), dtype=np.float32)
+                                    pixels = pixels[y0 - top:y1 - top, x0 - left:x1 - left]
+                                    alpha = pixels[..., 3:] / 255.0
                                     
-                                    # Get layer position
-                                    left = layer.offset[0]
-                                    top = layer.offset[1]
-                                    right = left + layer_img.width
-                                    bottom = top + layer_img.height
+                                    # Apply layer opacity (psd-tools reports it in the 0-255 range)
+                                    if layer.opacity < 255:
+                                        alpha *= layer.opacity / 255.0
                                     
-                                    # Paste the layer with alpha compositing
-                                    if layer_img.mode == 'RGBA':
-                                        rendered_image.paste(layer_img, (left, top, right, bottom), layer_img)
-                                    else:
-                                        rendered_image.paste(layer_img, (left, top, right, bottom))
+                                    # Over operator on the layer's region: I = (1 - a) * I + a * C
+                                    region = canvas[y0:y1, x0:x1]
+                                    region *= 1.0 - alpha
+                                    region += alpha * pixels[..., :3]
                                         
                             except Exception as e:
                                 logger.warning(f"Failed to process layer {layer.name}: {e}")
                     
+                    rendered_image = Image.fromarray(
+                        np.clip(canvas, 0, 255).round().astype(np.uint8), 'RGB')
+                    
                     if rendered_image and rendered_image.size[0] > 1 and rendered_image.size[1] > 1:
                         logger.info("✅ Flattened composite successful")
                     else:
@@ -408,10 +850,6 @@ class PSDProcessor:
                 
                 return debug_img
             
-            # Convert to RGB and return
-            if rendered_image.mode != 'RGB':
-                rendered_image = rendered_image.convert('RGB')
-            
             # Final verification: Check if image has actual content
             bbox = rendered_image.getbbox()
             if bbox:
@@ -425,46 +863,19 @@ class PSDProcessor:
             logger.error(f"Error in render_layer_combination_fixed: {e}")
             logger.error(traceback.format_exc())
             raise
-        finally:
-            # Clean up
-            if hasattr(psd, 'close'):
-                psd.close()
 
-    def _validate_visibility_settings(self, psd, target_color):
+    def _validate_visibility_settings(self, target_color_layers_visible: int,
+                                      other_color_layers_visible: int) -> bool:
         """
         Enhanced validation to ensure visibility is set correctly
-        """
-        all_colors = set()
-        for group_name in ['camera', 'colors', 'base']:
-            group_colors = self._get_layer_colors(group_name)
-            all_colors.update(group_colors)
         
-        target_color_layers_visible = 0
-        other_color_layers_visible = 0
-        
-        for layer in psd.descendants():
-            if not hasattr(layer, 'visible') or not hasattr(layer, 'name'):
-                continue
-                
-            layer_name = layer.name.lower().strip()
-            parent_name = layer.parent.name.lower() if layer.parent else 'root'
-            
-            # Check direct color layers (in colors, camera, base groups)
-            if parent_name in ['colors', 'camera', 'base'] and layer_name in all_colors:
-                if layer.visible:
-                    if layer_name == target_color.lower():
-                        target_color_layers_visible += 1
-                    else:
-                        other_color_layers_visible += 1
+        Args:
+            target_color_layers_visible: Visible layers belonging to the target color
+            other_color_layers_visible: Visible layers belonging to any other color
             
-            # Check layers within color groups
-            elif parent_name in all_colors:
-                if layer.visible:
-                    if parent_name == target_color.lower():
-                        target_color_layers_visible += 1
-                    else:
-                        other_color_layers_visible += 1
-        
+        Returns:
+            bool: True if only the target color is visible
+        """
         logger.info(f"Visibility validation: {target_color_layers_visible} target layers visible, {other_color_layers_visible} other color layers visible")
         
         # For proper isolation, we should have target color layers visible but no other color layers
@@ -479,7 +890,7 @@ class PSDProcessor:
         """
         Use the fixed rendering method
         """
-        return self._render_layer_combination_fixed(color_name)
+        return self._render_layer_combination_fixed(self.psd, color_name)
 
     def _should_show_layer(self, layer, layers_to_show: List[str]) -> bool:
         """
@@ -492,11 +903,11 @@ class PSDProcessor:
         Returns:
             bool: True if layer should be shown
         """
-        if not hasattr(layer, 'name') or not layer.name:
+        if not isinstance(layer, Layer) or not layer.name:
             return False
         
         layer_name = layer.name.lower().strip()
-        parent_name = layer.parent.name.lower() if hasattr(layer, 'parent') and layer.parent else ''
+        parent_name = layer.parent.name.lower() if layer.parent else ''
         
         # Always show @main group layers
         if parent_name == '@main':
@@ -511,50 +922,143 @@ class PSDProcessor:
             target = target.lower()
             # Check if target is in layer name or parent group name
             if (target in layer_name or 
-                (hasattr(layer, 'parent') and layer.parent and 
-                 target in getattr(layer.parent, 'name', '').lower())):
+                (layer.parent and target in layer.parent.name.lower())):
                 return True
         
         return False
     
-    def _render_layer(self, layer) -> Optional[Image.Image]:
+    def _render_workers(self, variant_count: int) -> int:
         """
-        Render a single layer to PIL Image
+        Number of processes to use for rendering variants
         
         Args:
-            layer: PSD layer object
+            variant_count: Number of variants to render
+            
+        Returns:
+            Worker count; 1 means render inline
+        """
+        # Daemonic processes (e.g. Celery prefork workers) cannot spawn children
+        if multiprocessing.current_process().daemon:
+            return 1
+        # GPU work is already parallel and CUDA does not survive a fork
+        if _get_nvjpeg() is not None or _get_torch() is not None:
+            return 1
+        workers = self.max_workers or os.cpu_count() or 1
+        return max(1, min(workers, variant_count))
+    
+    def _render_variant(self, color: str, output_path) -> Optional[Tuple[Tuple[int, int], str, str, int]]:
+        """
+        Render one color variant and save it as JPEG
+        
+        Args:
+            color: Color to render
+            output_path: Path to write the JPEG to
             
         Returns:
-            PIL Image or None if layer cannot be rendered
+            Tuple of (image size, image hash, file hash, file size),
+            or None if the render was invalid
+        """
+        logger.info(f"Processing color variant: {color}")
+        
+        # Reuse an earlier run's render of this unchanged PSD
+        cache_path = self._variant_cache_path(color)
+        if cache_path is not None:
+            cached = self._load_cached_variant(cache_path, output_path)
+            if cached is not None:
+                logger.info(f"Reusing cached render for color: {color}")
+                return cached
+        
+        # Render the combination
+        variant_image = self._render_layer_combination(color)
+        
+        # Verify the image is valid and different
+        if variant_image.size[0] <= 1 or variant_image.size[1] <= 1:
+            logger.error(f"Invalid image size for color {color}: {variant_image.size}")
+            return None
+        
+        # Calculate image hash before saving
+        image_hash = _image_md5(variant_image)
+        size = variant_image.size
+        
+        # Encode in memory so the file hash comes from the bytes written, not a re-read
+        data = _encode_jpeg(variant_image, self.quality)
+        file_hash = hashlib.md5(data).hexdigest()
+        with open(output_path, 'wb') as f:
+            f.write(data)
+        if cache_path is not None:
+            self._store_cached_variant(cache_path, data, size, image_hash)
+        
+        # Force garbage collection to free up resources
+        del variant_image
+        gc.collect()
+        
+        return size, image_hash, file_hash, len(data)
+    
+    def _variant_cache_path(self, color: str) -> Optional[Path]:
+        """
+        Cache entry for a color variant, keyed on the PSD's digest or its path, mtime and size
+        
+        Args:
+            color: Color of the variant
+            
+        Returns:
+            Path of the cached JPEG, or None if caching is disabled
+        """
+        if self.cache_dir is None:
+            return None
+        if self.psd_digest:
+            source = self.psd_digest
+        else:
+            stat = self.psd_path.stat()
+            source = f"{self.psd_path.resolve()}:{stat.st_mtime_ns}:{stat.st_size}"
+        key = hashlib.sha1(f"{source}:{color}:jpeg:{self.quality}".encode()).hexdigest()
+        return self.cache_dir / f"{key}.jpg"
+    
+    def _load_cached_variant(self, cache_path: Path, output_path) -> Optional[Tuple[Tuple[int, int], str, str, int]]:
+        """
+        Copy a cached variant to the output path
+        
+        Args:
+            cache_path: Path of the cached JPEG
+            output_path: Path to write the JPEG to
+            
+        Returns:
+            Tuple of (image size, image hash, file hash, file size), or None on a miss
         """
         try:
-            if isinstance(layer, PixelLayer):
-                # Get layer image
-                layer_image = layer.topil()
-                if layer_image:
-                    # Position the layer correctly
-                    positioned_image = Image.new('RGBA', 
-                                               (self.psd.width, self.psd.height), 
-                                               (0, 0, 0, 0))
-                    positioned_image.paste(layer_image, (layer.left, layer.top))
-                    return positioned_image
-            
-            elif isinstance(layer, Group):
-                # Render group as composite
-                group_image = Image.new('RGBA', 
-                                      (self.psd.width, self.psd.height), 
-                                      (0, 0, 0, 0))
-                
-                for sublayer in reversed(list(layer)):
-                    sublayer_image = self._render_layer(sublayer)
-                    if sublayer_image:
-                        group_image = Image.alpha_composite(group_image, sublayer_image)
-                
-                return group_image if group_image else None
-                
-        except Exception as e:
-            logger.warning(f"Failed to render layer {layer.name}: {e}")
+            # The metadata is written last, so its presence marks the entry complete
+            with open(cache_path.with_suffix('.json')) as f:
+                meta = json.load(f)
+            with open(cache_path, 'rb') as f:
+                data = f.read()
+        except (OSError, ValueError):
             return None
+        
+        with open(output_path, 'wb') as f:
+            f.write(data)
+        return tuple(meta['size']), meta['image_hash'], hashlib.md5(data).hexdigest(), len(data)
+    
+    def _store_cached_variant(self, cache_path: Path, data, size: Tuple[int, int], image_hash: str):
+        """
+        Publish a rendered variant to the cache
+        
+        Args:
+            cache_path: Path of the cached JPEG
+            data: Encoded JPEG bytes
+            size: Image size of the variant
+            image_hash: Pixel hash of the variant
+        """
+        try:
+            # Write beside the final names, then rename into place atomically
+            for path, payload in ((cache_path, data),
+                                  (cache_path.with_suffix('.json'),
+                                   json.dumps({'size': list(size), 'image_hash': image_hash}).encode())):
+                fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir)
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(payload)
+                os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not cache render in {self.cache_dir}: {e}")
     
     def generate_variants(self) -> List[Dict]:
         """
@@ -579,61 +1083,59 @@ class PSDProcessor:
         base_filename = self.psd_path.stem
         
         variants = []
+        pending = []
         
         logger.info(f"Generating variants for {len(valid_color_names)} colors: {valid_color_names}")
         
-        for color in valid_color_names:
-            try:
-                logger.info(f"Processing color variant: {color}")
-                
-                # Render the combination
-                variant_image = self._render_layer_combination(color)
-                
-                # Verify the image is valid and different
-                if variant_image.size[0] <= 1 or variant_image.size[1] <= 1:
-                    logger.error(f"Invalid image size for color {color}: {variant_image.size}")
-                    continue
-                
-                # Calculate image hash before saving
-                import hashlib
-                image_hash = hashlib.md5(variant_image.tobytes()).hexdigest()
-                
-                # Save the variant
+        # Render colors in parallel; each worker opens the PSD once from its path
+        workers = self._render_workers(len(valid_color_names))
+        executor = None
+        if workers > 1:
+            executor = ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=_init_render_worker,
+                initargs=(str(self.psd_path), str(self.output_dir), self.quality,
+                          str(self.cache_dir) if self.cache_dir else None, self.psd_digest)
+            )
+        
+        try:
+            for color in valid_color_names:
                 output_filename = f"{base_filename}-{color}-metalware_1.jpg"
                 output_path = self.output_dir / output_filename
-                variant_image.save(output_path, quality=95, subsampling=0)
-                
-                # Calculate file hash after saving
-                with open(output_path, 'rb') as f:
-                    file_hash = hashlib.md5(f.read()).hexdigest()
-                
-                # Get file size for verification
-                file_size = output_path.stat().st_size
-                
-                variants.append({
-                    'filename': output_filename,
-                    'path': str(output_path),
-                    'color': color,
-                    'metalware': 'metalware',
-                    'size': variant_image.size,
-                    'file_size': file_size,
-                    'image_hash': image_hash,
-                    'file_hash': file_hash
-                })
-                
-                logger.info(f"Generated variant: {output_filename}")
-                logger.info(f"  Size: {variant_image.size}, File size: {file_size} bytes")
-                logger.info(f"  Image hash: {image_hash}")
-                logger.info(f"  File hash: {file_hash}")
-                
-                # Force garbage collection to free up resources
-                import gc
-                gc.collect()
-                
-            except Exception as e:
-                logger.error(f"Failed to generate variant for color {color}: {e}")
-                logger.error(traceback.format_exc())
-                continue
+                future = executor.submit(_render_one, color, str(output_path)) if executor else None
+                pending.append((color, output_filename, output_path, future))
+            
+            for color, output_filename, output_path, future in pending:
+                try:
+                    # Without a pool, render inline from the already loaded PSD
+                    rendered = future.result() if future else self._render_variant(color, output_path)
+                    if rendered is None:
+                        continue
+                    size, image_hash, file_hash, file_size = rendered
+                    
+                    variants.append({
+                        'filename': output_filename,
+                        'path': str(output_path),
+                        'color': color,
+                        'metalware': 'metalware',
+                        'size': size,
+                        'file_size': file_size,
+                        'image_hash': image_hash,
+                        'file_hash': file_hash
+                    })
+                    
+                    logger.info(f"Generated variant: {output_filename}")
+                    logger.info(f"  Size: {size}, File size: {file_size} bytes")
+                    logger.info(f"  Image hash: {image_hash}")
+                    logger.info(f"  File hash: {file_hash}")
+                    
+                except Exception as e:
+                    logger.error(f"Failed to generate variant for color {color}: {e}")
+                    logger.error(traceback.format_exc())
+                    continue
+        finally:
+            if executor:
+                executor.shutdown()
         
         # Check for duplicate hashes
         self._check_duplicate_variants(variants)
@@ -657,22 +1159,25 @@ class PSDProcessor:
             else:
                 logger.info(f"✅ Unique variant: {colors[0]} (hash: {file_hash})")
         
-        # Additional check: Compare image content
+        # Additional check: Compare image content via the pixel hashes taken before encoding
         if len(variants) > 1:
-            from PIL import ImageChops
             base_variant = variants[0]
-            base_image = Image.open(base_variant['path'])
-            
+            base_pixels = None
             for variant in variants[1:]:
-                try:
-                    compare_image = Image.open(variant['path'])
-                    diff = ImageChops.difference(base_image, compare_image)
-                    if diff.getbbox():
-                        logger.info(f"✅ Images {base_variant['color']} and {variant['color']} are visually different")
-                    else:
-                        logger.warning(f"⚠️  Images {base_variant['color']} and {variant['color']} are visually identical")
-                except Exception as e:
-                    logger.error(f"Error comparing images: {e}")
+                identical = variant['image_hash'] == base_variant['image_hash']
+                if identical:
+                    # Equal hashes are the rare case: confirm on the pixels without building a diff image
+                    try:
+                        if base_pixels is None:
+                            base_pixels = np.asarray(Image.open(base_variant['path']))
+                        pixels = np.asarray(Image.open(variant['path']))
+                        identical = pixels.shape == base_pixels.shape and not np.any(pixels != base_pixels)
+                    except Exception as e:
+                        logger.error(f"Error comparing images: {e}")
+                if not identical:
+                    logger.info(f"✅ Images {base_variant['color']} and {variant['color']} are visually different")
+                else:
+                    logger.warning(f"⚠️  Images {base_variant['color']} and {variant['color']} are visually identical")
     
     def process(self) -> Tuple[bool, List[Dict]]:
         """
@@ -682,8 +1187,8 @@ class PSDProcessor:
             Tuple of (success, variants_list)
         """
         try:
-            # Load PSD
-            if not self.load_psd():
+            # Load PSD unless the caller already has
+            if self.psd is None and not self.load_psd():
                 return False, []
             
             # Generate variants
@@ -715,15 +1220,23 @@ def main():
     Main function for testing
     """
     import sys
+    global USE_NVJPEG
     
-    if len(sys.argv) < 2:
-        print("Usage: python psd_processor.py <psd_file> [output_dir]")
+    args = [arg for arg in sys.argv[1:] if arg not in ('--gpu-jpeg', '--cache')]
+    if not args:
+        print("Usage: python psd_processor.py <psd_file> [output_dir] [--gpu-jpeg] [--cache]")
         sys.exit(1)
     
-    psd_file = sys.argv[1]
-    output_dir = sys.argv[2] if len(sys.argv) > 2 else None
+    if '--gpu-jpeg' in sys.argv:
+        USE_NVJPEG = True
+    
+    psd_file = args[0]
+    output_dir = args[1] if len(args) > 1 else None
+    
+    # Reuse renders from earlier runs into the same output directory
+    cache_dir = os.path.join(output_dir, '.cache') if '--cache' in sys.argv and output_dir else None
     
-    processor = PSDProcessor(psd_file, output_dir)
+    processor = PSDProcessor(psd_file, output_dir, cache_dir=cache_dir)
     success, variants = processor.process()
     
     if success:
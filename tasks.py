@@ -0,0 +1,197 @@
+"""
+Background tasks for the PSD Processing Web Service.
+
+PSD processing is CPU-bound and can take minutes, so it runs on a Celery
+worker pool instead of inside the HTTP request.
+
+Usage:
+    celery -A tasks worker --concurrency=4 --loglevel=info
+"""
+
+import os
+import json
+import shutil
+import logging
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+
+from celery import Celery
+from psd_layer_processor import PSDProcessor
+
+logger = logging.getLogger(__name__)
+
+BROKER_URL = os.environ.get('CELERY_BROKER_URL', 'redis://localhost:6379/0')
+RESULT_BACKEND = os.environ.get('CELERY_RESULT_BACKEND', BROKER_URL)
+
+# Written last into a cache entry; its presence marks the entry complete
+CACHE_MANIFEST_FILE = 'result.json'
+
+# Per-variant renders, shared between jobs through the cache folder. They only help while
+# a job (or a redelivery of it) is running; afterwards the job's result entry serves hits.
+VARIANT_CACHE_DIR = 'variants'
+VARIANT_CACHE_MAX_AGE = 60 * 60
+
+# Least recently used cache entries are evicted once the cache outgrows this size
+CACHE_MAX_SIZE = int(os.environ.get('CACHE_MAX_SIZE_MB', 5 * 1024)) * 1024 * 1024
+
+celery = Celery('psd', broker=BROKER_URL, backend=RESULT_BACKEND)
+celery.conf.update(
+    task_track_started=True,
+    # One long job per worker process at a time
+    worker_prefetch_multiplier=1,
+    task_acks_late=True,
+)
+
+
+def store_cached_result(cache_dir: str, psd_path: str, output_dir: str,
+                        generated_files: List[str]):
+    """
+    Publish a job's generated files as a content-addressed cache entry.
+
+    Args:
+        cache_dir: Cache entry directory (named by PSD hash and quality)
+        psd_path: Path to the processed PSD file
+        output_dir: Directory holding the generated files
+        generated_files: Names of the generated files
+    """
+    if os.path.exists(cache_dir):
+        return
+
+    # Build the entry beside its final location, then rename it into place atomically
+    tmp_dir = tempfile.mkdtemp(dir=os.path.dirname(cache_dir))
+    try:
+        for filename in generated_files:
+            src = os.path.join(output_dir, filename)
+            dst = os.path.join(tmp_dir, filename)
+            try:
+                os.link(src, dst)
+            except OSError:
+                shutil.copy2(src, dst)
+
+        with open(os.path.join(tmp_dir, CACHE_MANIFEST_FILE), 'w') as f:
+            json.dump({
+                'input_stem': Path(psd_path).stem,
+                'generated_files': generated_files
+            }, f)
+
+        os.rename(tmp_dir, cache_dir)
+    except OSError as e:
+        # Another worker published the same entry first, or the cache is unavailable
+        logger.warning(f"Could not cache results in {cache_dir}: {e}")
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def prune_cache(cache_root: str, max_size: int = CACHE_MAX_SIZE):
+    """
+    Evict least recently used cache entries until the cache fits in max_size bytes.
+
+    Cache hits touch an entry's manifest, so its mtime records the last use.
+
+    Args:
+        cache_root: Directory holding the cache entries
+        max_size: Maximum total size of the cache entries in bytes
+    """
+    entries = []
+    total = 0
+    for entry in os.scandir(cache_root):
+        try:
+            if not entry.is_dir(follow_symlinks=False):
+                continue
+            # Entries without a manifest are still being published
+            last_used = os.stat(os.path.join(entry.path, CACHE_MANIFEST_FILE)).st_mtime
+            size = sum(f.stat(follow_symlinks=False).st_size for f in os.scandir(entry.path))
+        except OSError:
+            continue
+        entries.append((last_used, size, entry.path))
+        total += size
+
+    for last_used, size, path in sorted(entries):
+        if total <= max_size:
+            break
+        logger.info(f"Evicting cache entry {path} ({size} bytes)")
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
+
+
+def prune_variant_cache(variant_dir: str, max_age: int = VARIANT_CACHE_MAX_AGE):
+    """
+    Delete rendered variants older than max_age seconds.
+
+    Args:
+        variant_dir: Directory holding the per-variant renders
+        max_age: Maximum age of a render in seconds
+    """
+    cutoff = time.time() - max_age
+    for entry in os.scandir(variant_dir):
+        try:
+            if entry.stat(follow_symlinks=False).st_mtime < cutoff:
+                os.remove(entry.path)
+        except OSError:
+            continue
+
+
+@celery.task(name='psd.run_psd_job')
+def run_psd_job(psd_path: str, output_dir: str, quality: int,
+                cache_dir: Optional[str] = None, digest: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Process a PSD file and generate JPG variants.
+
+    The PSD's upload directory is deleted afterwards; uploads may live on tmpfs.
+
+    Args:
+        psd_path: Path to the saved PSD file, in its own upload directory
+        output_dir: Directory to write generated files to
+        quality: JPEG quality requested by the client
+        cache_dir: Cache entry to publish the results to (optional)
+        digest: SHA-256 of the PSD, used to share variant renders between jobs (optional)
+
+    Returns:
+        Dict describing the job result
+    """
+    logger.info(f"Processing PSD file: {psd_path}")
+
+    # Identical PSDs processed concurrently, or a job redelivered after a worker
+    # crash, reuse the variants already rendered
+    variant_dir = None
+    if cache_dir and digest:
+        variant_dir = os.path.join(os.path.dirname(cache_dir), VARIANT_CACHE_DIR)
+
+    try:
+        processor = PSDProcessor(psd_path, output_dir, quality=quality,
+                                 cache_dir=variant_dir, psd_digest=digest)
+        if not processor.load_psd():
+            return {
+                'error': 'Invalid PSD file structure',
+                'success': False
+            }
+
+        # Process the PSD and get results
+        success, variants = processor.process()
+        processor.cleanup()
+    finally:
+        shutil.rmtree(os.path.dirname(psd_path), ignore_errors=True)
+
+    if not success:
+        return {
+            'error': 'Failed to process PSD',
+            'success': False
+        }
+
+    # Get the list of generated files
+    results = [v['filename'] for v in variants if 'filename' in v]
+    generated_files = [os.path.basename(f) for f in results]
+
+    if cache_dir:
+        store_cached_result(cache_dir, psd_path, output_dir, generated_files)
+        prune_cache(os.path.dirname(cache_dir))
+    if variant_dir:
+        prune_variant_cache(variant_dir)
+
+    return {
+        'input_file': os.path.basename(psd_path),
+        'output_dir': output_dir,
+        'generated_files': generated_files,
+        'success': True
+    }
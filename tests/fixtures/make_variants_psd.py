@@ -0,0 +1,66 @@
+"""
+Build variants.psd, the small document used by tests/test_visibility.py.
+
+Usage:
+    python tests/fixtures/make_variants_psd.py
+"""
+
+import os
+
+from PIL import Image
+from psd_tools import PSDImage
+from psd_tools.api.layers import Group, PixelLayer
+
+WIDTH, HEIGHT = 32, 24
+COLORS = {'red': (220, 30, 30), 'blue': (30, 30, 220), 'green': (30, 200, 30)}
+
+
+def main():
+    psd = PSDImage.new('RGB', (WIDTH, HEIGHT))
+
+    def pixel_layer(name, color, box, parent):
+        image = Image.new('RGBA', (box[2] - box[0], box[3] - box[1]), color + (255,))
+        layer = PixelLayer.frompil(image, psd, name, box[1], box[0])
+        parent.append(layer)
+        return layer
+
+    def group(name, parent):
+        layer = Group.new(psd, name=name)
+        parent.append(layer)
+        return layer
+
+    bg = group('bg', psd)
+    pixel_layer('paper', (240, 240, 240), (0, 0, WIDTH, HEIGHT), bg)
+
+    # One group per color in base, the first with two layers
+    base = group('base', psd)
+    for i, (name, color) in enumerate(COLORS.items()):
+        color_group = group(name, base)
+        pixel_layer(f'Layer {i} copy', color, (2, 2, 14, 22), color_group)
+        if i == 0:
+            pixel_layer(f'Layer {i} shade', (90, 10, 10), (2, 16, 14, 22), color_group)
+
+    colors = group('colors', psd)
+    for name, color in COLORS.items():
+        pixel_layer(name, tuple(v // 2 for v in color), (4, 4, 12, 20), colors)
+
+    camera = group('camera', psd)
+    for name, color in COLORS.items():
+        pixel_layer(name, tuple(min(255, v + 30) for v in color), (16, 2, 30, 10), camera)
+
+    # @main mixes a plain layer with a color layer, which validation does not count
+    main_group = group('@main', psd)
+    pixel_layer('metalware', (180, 180, 180), (16, 12, 30, 22), main_group)
+    pixel_layer('red', (255, 120, 120), (20, 14, 26, 20), main_group)
+
+    pixel_layer('glare', (255, 255, 255), (0, 0, 6, 4), psd)
+
+    # Hidden in the file: variants must not depend on the saved visibility
+    colors[1].visible = False
+    camera[2].visible = False
+
+    psd.save(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'variants.psd'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+"""
+Tests for PSD header validation on resumable (tus) uploads.
+"""
+
+import fcntl
+import os
+import struct
+
+import httpx
+import pytest
+
+import app as app_module
+from app import app, PSD_HEADER_SIZE
+
+TUS_HEADERS = {'Tus-Resumable': '1.0.0'}
+
+
+def psd_header(width: int, height: int, version: int = 1) -> bytes:
+    """Build a PSD file header: signature, version, reserved, channels, height, width, depth, mode."""
+    return b'8BPS' + struct.pack('>H6xHIIHH', version, 3, height, width, 8, 3)
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setitem(app.config, 'UPLOAD_FOLDER', str(tmp_path))
+    return app.test_client()
+
+
+def create_upload(client, length: int):
+    return client.post('/api/uploads', headers={**TUS_HEADERS, 'Upload-Length': str(length)})
+
+
+def patch_chunks(client, location: str, chunks):
+    """Send consecutive PATCH requests, stopping at the first that is not accepted."""
+    offset = 0
+    for chunk in chunks:
+        resp = client.patch(location, data=chunk, headers={
+            **TUS_HEADERS,
+            'Upload-Offset': str(offset),
+            'Content-Type': 'application/offset+octet-stream'
+        })
+        if resp.status_code != 204:
+            return resp
+        offset = int(resp.headers['Upload-Offset'])
+    return resp
+
+
+def test_rejects_upload_shorter_than_header(client):
+    assert create_upload(client, PSD_HEADER_SIZE - 1).status_code == 400
+
+
+def test_short_first_patch_still_checks_signature(client, tmp_path):
+    data = b'GIF89a' + b'\0' * 64
+    location = create_upload(client, len(data)).headers['Location']
+    
+    resp = patch_chunks(client, location, [data[:3], data[3:10], data[10:]])
+    
+    assert resp.status_code == 400
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_short_first_patch_still_checks_canvas_size(client):
+    data = psd_header(20000, 20000) + b'\0' * 64
+    location = create_upload(client, len(data)).headers['Location']
+    
+    resp = patch_chunks(client, location, [data[:1], data[1:PSD_HEADER_SIZE + 8], data[PSD_HEADER_SIZE + 8:]])
+    
+    assert resp.status_code == 413
+
+
+def test_short_first_patch_accepts_valid_header(client):
+    data = psd_header(640, 480) + b'\0' * 64
+    location = create_upload(client, len(data)).headers['Location']
+    
+    resp = patch_chunks(client, location, [data[:5], data[5:40]])
+    
+    assert resp.status_code == 204
+    assert resp.headers['Upload-Offset'] == '40'
+
+
+def test_patch_while_upload_is_locked(client, tmp_path):
+    data = psd_header(640, 480) + b'\0' * 64
+    location = create_upload(client, len(data)).headers['Location']
+    data_path = tmp_path / location.rsplit('/', 1)[1] / 'upload.psd'
+    
+    # Another request is still streaming a chunk into the upload
+    with open(data_path, 'ab') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        resp = patch_chunks(client, location, [data])
+    
+    assert resp.status_code == 423
+    assert data_path.stat().st_size == 0
+
+
+def test_completed_upload_is_queued_once(client, monkeypatch):
+    queued = []
+    monkeypatch.setattr(app_module, 'queue_job', lambda *args: queued.append(args))
+    data = psd_header(640, 480) + b'\0' * 64
+    location = create_upload(client, len(data)).headers['Location']
+    
+    # A retry of the final chunk after it was written
+    assert patch_chunks(client, location, [data]).status_code == 204
+    resp = patch_chunks(client, location, [data])
+    
+    assert resp.status_code == 409
+    assert resp.headers['Upload-Offset'] == str(len(data))
+    assert len(queued) == 1
+
+
+def test_abandoned_upload_expires(client, tmp_path):
+    resp = create_upload(client, 100)
+    assert 'Upload-Expires' in resp.headers
+    job_dir = tmp_path / resp.headers['Location'].rsplit('/', 1)[1]
+    
+    # Last chunk arrived longer ago than the expiry
+    stale = (job_dir / 'upload.psd').stat().st_mtime - app_module.UPLOAD_EXPIRY - 1
+    os.utime(job_dir / 'upload.psd', (stale, stale))
+    create_upload(client, 100)
+    
+    assert not job_dir.exists()
+
+
+@pytest.mark.parametrize('send_length', [True, False])
+def test_url_download_over_size_limit(client, tmp_path, monkeypatch, send_length):
+    monkeypatch.setitem(app.config, 'MAX_CONTENT_LENGTH', 1024)
+    body = psd_header(640, 480) + b'\0' * 2048
+    
+    def handler(request):
+        headers = {} if send_length else {'Transfer-Encoding': 'chunked'}
+        stream = body if send_length else httpx.ByteStream(body)
+        return httpx.Response(200, headers=headers, content=stream)
+    
+    monkeypatch.setattr(app_module, 'http_client', httpx.Client(transport=httpx.MockTransport(handler)))
+    
+    resp = client.post('/api/process', data={'url': 'http://example.com/big.psd'})
+    
+    assert resp.status_code == 413
+    assert list(tmp_path.iterdir()) == []
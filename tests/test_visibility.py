@@ -0,0 +1,82 @@
+"""
+Regression tests for the per-color layer visibility rules.
+"""
+
+import os
+
+import pytest
+
+from psd_layer_processor import PSDProcessor
+
+FIXTURE = os.path.join(os.path.dirname(__file__), 'fixtures', 'variants.psd')
+COLORS = ('red', 'blue', 'green')
+
+
+def expected_visibility(color: str) -> dict:
+    """Visibility of every layer, keyed by "parent/name", when rendering color."""
+    shown = {name: name == color for name in COLORS}
+    return {
+        # Containers, background, non-color and ungrouped layers are always shown
+        'root/bg': True,
+        'bg/paper': True,
+        'root/base': True,
+        'root/colors': True,
+        'root/camera': True,
+        'root/@main': True,
+        '@main/metalware': True,
+        'root/glare': True,
+        # Only the target color, wherever it appears
+        'base/red': shown['red'],
+        'base/blue': shown['blue'],
+        'base/green': shown['green'],
+        'red/layer 0 copy': shown['red'],
+        'red/layer 0 shade': shown['red'],
+        'blue/layer 1 copy': shown['blue'],
+        'green/layer 2 copy': shown['green'],
+        'colors/red': shown['red'],
+        'colors/blue': shown['blue'],
+        'colors/green': shown['green'],
+        'camera/red': shown['red'],
+        'camera/blue': shown['blue'],
+        'camera/green': shown['green'],
+        '@main/red': shown['red'],
+    }
+
+
+@pytest.fixture(scope='module')
+def processor(tmp_path_factory):
+    processor = PSDProcessor(FIXTURE, str(tmp_path_factory.mktemp('variants')))
+    assert processor.load_psd()
+    yield processor
+    processor.cleanup()
+
+
+def test_fixture_colors(processor):
+    assert processor._all_colors_set == frozenset(COLORS)
+
+
+@pytest.mark.parametrize('color', COLORS)
+def test_visibility_map(processor, color):
+    visibility, _, _ = processor._layer_visibility_fixed(color)
+    
+    actual = {f"{layer.parent.name.lower()}/{layer.name.lower()}": visibility[id(layer)]
+              for layer in processor.psd.descendants()}
+    
+    assert actual == expected_visibility(color)
+
+
+@pytest.mark.parametrize('color, target_visible', [('red', 5), ('blue', 4), ('green', 4)])
+def test_validation_counts(processor, color, target_visible):
+    # base group + its layers + colors + camera; color layers in @main are not counted
+    _, target, other = processor._layer_visibility_fixed(color)
+    
+    assert (target, other) == (target_visible, 0)
+    assert processor._validate_visibility_settings(target, other)
+
+
+def test_saved_visibility_is_untouched(processor):
+    before = [layer.visible for layer in processor.psd.descendants()]
+    for color in COLORS:
+        processor._render_layer_combination_fixed(processor.psd, color)
+    
+    assert [layer.visible for layer in processor.psd.descendants()] == before